@@ -14,6 +14,7 @@ from .job_run_htcondor import job_run_htcondor
 from .job_run_local import job_run_local
 from .job_run_slurm import job_run_slurm
 from .simulation_study import SimulationStudy
+from .tools import YamlLoader
 
 
 def generate_parser():
@@ -213,7 +214,7 @@ def main():
         # load the config yaml file into a dict
         try:
             with open(args.config, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=YamlLoader)
             if "run_local" in config:
                 config = config["run_local"]
                 if config is None:
@@ -235,7 +236,7 @@ def main():
         # load the config yaml file into a dict
         try:
             with open(args.config, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=YamlLoader)
             if "run_htcondor" in config:
                 config = config["run_htcondor"]
                 if config is None:
@@ -257,7 +258,7 @@ def main():
         # load the config yaml file into a dict
         try:
             with open(args.config, "r", encoding="utf-8") as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=YamlLoader)
             if "run_slurm" in config:
                 config = config["run_slurm"]
                 if config is None:
@@ -396,11 +397,11 @@ def main():
         scan_folder = os.path.join(sim_folder, "scan")
         # get list of all files in a sim finished folder
         files = os.listdir(os.path.join(scan_folder, sim.finished[0]))
-        # filter files based on regex
-        if args.file is not None:
-            files = [f for f in files if re.match(args.file, f)]
-        else:
-            files = [f for f in files if re.match(r".*\.(h5|pkl)", f)]
+        # filter files based on regex, compiled once for all the files
+        file_pattern = re.compile(
+            args.file if args.file is not None else r".*\.(h5|pkl)"
+        )
+        files = [f for f in files if file_pattern.match(f)]
 
         # create target folder
         os.makedirs(os.path.join(sim_folder, args.target), exist_ok=True)
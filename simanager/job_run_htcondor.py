@@ -1,13 +1,17 @@
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import pkg_resources
-import yaml
 
 from .simulation_study import SimulationStudy
-from .tools import clean_script_from_templates
+from .tools import (
+    IO_POOL_WORKERS,
+    PlaceholderTemplate,
+    clean_script_from_templates,
+)
 
 INITIAL_INSTRUCTIONS_HTCONDOR_DEFAULT = """#!/bin/bash
 # initial instructions
@@ -369,49 +373,38 @@ def job_run_htcondor(simulation_study: SimulationStudy, **kwargs):
     eos_sif_in_dest = os.path.join(htcondor_support_folder, "eos_stage_in.py")
     shutil.copyfile(eos_sif_in, eos_sif_in_dest)
 
-    # specializations of the submit file
-    htcondor_submit_str = htcondor_submit_str.replace(
-        "__REPLACE_WITH_REQUEST_CPUS__", str(request_cpus)
-    )
-    htcondor_submit_str = htcondor_submit_str.replace(
-        "__REPLACE_WITH_TIME_LIMIT__", time_limit if not run_test else test_time_limit
-    )
-    htcondor_submit_str = htcondor_submit_str.replace(
-        "__REPLACE_WITH_QUEUE_FILE__",
-        os.path.join(htcondor_support_folder, "queue.txt"),
-    )
-    htcondor_submit_str = htcondor_submit_str.replace(
-        "__REPLACE_WITH_EOSSTAGEIN__", eos_sif_in_dest
-    )
-    if request_gpus:
-        htcondor_submit_str = htcondor_submit_str.replace(
-            "__REPLACE_WITH_REQUEST_GPUS__", "1"
-        )
+    # specializations of the submit file, collected here and substituted in
+    # a single pass once the requirements are known
     # log name has the format htcondor_yyyy_mm_dd_hh_mm_ss.log
     log_name = "htcondor_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".log"
-    htcondor_submit_str = htcondor_submit_str.replace(
-        "__REPLACE_WITH_LOG_PATH__", os.path.join(log_path, log_name)
-    )
+    submit_placeholders = {
+        "REQUEST_CPUS": str(request_cpus),
+        "TIME_LIMIT": time_limit if not run_test else test_time_limit,
+        "QUEUE_FILE": os.path.join(htcondor_support_folder, "queue.txt"),
+        "EOSSTAGEIN": eos_sif_in_dest,
+        "LOG_PATH": os.path.join(log_path, log_name),
+    }
+    if request_gpus:
+        submit_placeholders["REQUEST_GPUS"] = "1"
 
     # load the simulation info
-    simulation_info_file = os.path.join(sim_folder, "simulation_info.yaml")
-    with open(simulation_info_file, "r", encoding="utf-8") as f:
-        simulation_info = yaml.safe_load(f)
+    simulation_info = simulation_study._read_info()
 
     # get the list of simulations to run
     if run_test:
         simulations_to_run = ["test"]
     else:
-        simulations_to_run = simulation_info["sim_not_started"]
+        sims_by_status = simulation_study._sims_by_status(simulation_info)
+        simulations_to_run = sims_by_status["not_started"]
     # get the root folder
     root_folder = simulation_info["root_folder"]
 
-    # specialize the initial and final instructions
+    # specialize the initial and final instructions, the placeholders that
+    # are not specialized here (e.g. the case name) are left in place
+    initial_placeholders = {"CVMFS_PATH": cvmfs_path}
     if use_requirements:
         # specialize initial instructions accordingly
-        initial_instructions = initial_instructions.replace(
-            "__REPLACE_WITH_LOAD_VENV__", INSTRUCTIONS_CREATE_VENV
-        )
+        initial_placeholders["LOAD_VENV"] = INSTRUCTIONS_CREATE_VENV
         # process the requirements file
         with open(requirements_path, "r", encoding="utf-8") as f:
             requirements_content = f.read()
@@ -423,55 +416,83 @@ def job_run_htcondor(simulation_study: SimulationStudy, **kwargs):
         with open(requirements_file_path, "w", encoding="utf-8") as f:
             f.write(requirements_content)
         # specialize the submit file
-        htcondor_submit_str = htcondor_submit_str.replace(
-            "__REPLACE_WITH_REQUIREMENTS__", ", " + requirements_file_path
-        )
+        submit_placeholders["REQUIREMENTS"] = ", " + requirements_file_path
 
     else:
-        # specialize initial instructions accordingly
-        initial_instructions = initial_instructions.replace(
-            "__REPLACE_WITH_LOAD_VENV__", INSTRUCTIONS_LOAD_VENV
-        )
-        initial_instructions = initial_instructions.replace(
-            "__REPLACE_WITH_VENV_PATH__", venv_path
-        )
+        # specialize initial instructions accordingly, the venv path is
+        # also replaced in the instructions to load it
+        initial_placeholders["LOAD_VENV"] = PlaceholderTemplate(
+            INSTRUCTIONS_LOAD_VENV
+        ).safe_substitute(VENV_PATH=venv_path)
+        initial_placeholders["VENV_PATH"] = venv_path
         # specialize the submit file
-        htcondor_submit_str = htcondor_submit_str.replace(
-            "__REPLACE_WITH_REQUIREMENTS__", ""
-        )
+        submit_placeholders["REQUIREMENTS"] = ""
 
-    initial_instructions = initial_instructions.replace(
-        "__REPLACE_WITH_CVMFS_PATH__", cvmfs_path
+    htcondor_submit_str = PlaceholderTemplate(htcondor_submit_str).safe_substitute(
+        submit_placeholders
     )
+
+    # the name of the parameter file has a placeholder of its own, with three
+    # underscores on each side, that the template pattern would not match
+    # as a whole
     initial_instructions = initial_instructions.replace(
         "___REPLACE_WITH_YAML_NAME___", simulation_study.config_file
     )
+    initial_instructions = PlaceholderTemplate(initial_instructions).safe_substitute(
+        initial_placeholders
+    )
+
+    final_instructions = PlaceholderTemplate(final_instructions).safe_substitute(
+        EOS_DIR=eos_dir
+    )
+
+    # the instructions wrapped around the main files are the same for all
+    # the simulations, up to the case name
+    main_file_prefix = initial_instructions + "\n"
+    main_file_suffix = "\n" + final_instructions
 
-    final_instructions = final_instructions.replace("__REPLACE_WITH_EOS_DIR__", eos_dir)
+    scan_folder = os.path.join(root_folder, "scan")
 
-    queue_file_content = ""
-    for sim in simulations_to_run:
-        folder_path = os.path.join(root_folder, "scan", sim)
+    # wrap the main file of a simulation with the instructions, and return
+    # its line of the queue file
+    def prepare_simulation(sim):
+        folder_path = os.path.join(scan_folder, sim)
         main_file = os.path.join(folder_path, simulation_study.main_file)
 
         with open(main_file, "r", encoding="utf-8") as f:
             main_file_content = f.read()
 
-        main_file_content = clean_script_from_templates(main_file_content)
-
-        main_file_content = (
-            initial_instructions + "\n" + main_file_content + "\n" + final_instructions
-        )
-
-        main_file_content = main_file_content.replace("__REPLACE_WITH_CASENAME__", sim)
-
-        with open(main_file, "w", encoding="utf-8") as f:
-            f.write(main_file_content)
+        # if the main file is already wrapped with the very same instructions
+        # (e.g. when submitting again after some failures), there is no need
+        # to write it again
+        if not (
+            main_file_content.startswith(
+                main_file_prefix.replace("__REPLACE_WITH_CASENAME__", sim)
+            )
+            and main_file_content.endswith(
+                main_file_suffix.replace("__REPLACE_WITH_CASENAME__", sim)
+            )
+        ):
+            main_file_content = clean_script_from_templates(main_file_content)
+
+            main_file_content = (
+                main_file_prefix + main_file_content + main_file_suffix
+            ).replace("__REPLACE_WITH_CASENAME__", sim)
+
+            with open(main_file, "w", encoding="utf-8") as f:
+                f.write(main_file_content)
 
         # fill the queue file line
-        queue_file_content += f"{main_file}, {folder_path}, {os.path.join(stdout_path, sim + '.out')}, {os.path.join(stderr_path, sim + '.err')}, {os.path.join(eos_dir, sim)}/ \n"
+        return f"{main_file}, {folder_path}, {os.path.join(stdout_path, sim + '.out')}, {os.path.join(stderr_path, sim + '.err')}, {os.path.join(eos_dir, sim)}/ \n"
 
-        print(f"Added {sim} to the queue file")
+    # map keeps the queue lines in the order of the simulations, and they are
+    # written to the queue file as they come, without holding the whole
+    # content in memory
+    queue_file = os.path.join(htcondor_support_folder, "queue.txt")
+    with ThreadPoolExecutor(max_workers=IO_POOL_WORKERS) as executor, open(
+        queue_file, "w", encoding="utf-8"
+    ) as f:
+        f.writelines(executor.map(prepare_simulation, simulations_to_run))
 
     # save the submit file
     htcondor_submit_file = os.path.join(
@@ -482,11 +503,6 @@ def job_run_htcondor(simulation_study: SimulationStudy, **kwargs):
 
     print("Total number of jobs:", len(simulations_to_run))
 
-    # save the queue file
-    queue_file = os.path.join(htcondor_support_folder, "queue.txt")
-    with open(queue_file, "w", encoding="utf-8") as f:
-        f.write(queue_file_content)
-
     if bump_schedd:
         # bump the schedd
         print("Bumping the schedd...")
@@ -1,16 +1,18 @@
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from multiprocessing import Manager, Pool
+from multiprocessing import Lock, Pool, Value
 import shutil
 
-import yaml
-
 from .simulation_study import SimulationStudy
-from .tools import clean_script_from_templates
+from .tools import (
+    IO_POOL_WORKERS,
+    clean_script_from_templates,
+    write_file_atomically,
+)
 
-INITIAL_INSTRUCTIONS_LOCAL_DEFAULT = """
-#!/bin/bash
+INITIAL_INSTRUCTIONS_LOCAL_DEFAULT = """#!/bin/bash
 # initial instructions
 SIMPATH=$(pwd)
 #___END_INITIAL_INSTRUCTIONS___
@@ -29,14 +31,75 @@ fi
 """
 
 
+# lock shared by all the pool workers, serializing the simulation status
+# updates, set by _init_worker
+_STATUS_LOCK = None
+
+# flag shared by all the pool workers, set to 0 to stop starting new
+# simulations, set by _init_worker
+_RUN_FLAG = None
+
+# simulation study shared by all the pool workers, handed over once per
+# worker instead of once per simulation, set by _init_worker
+_SIMULATION_STUDY = None
+
+# environments of the simulations launched by this process, keyed by GPU ID
+_SIMULATION_ENVS = {}
+
+
+def _simulation_env(gpu_id):
+    """Returns the environment for a simulation running on the given GPU.
+    The environment is copied from os.environ only once per process and GPU
+    ID, and then reused for all the following simulations.
+
+    Parameters
+    ----------
+    gpu_id : int
+        The ID of the GPU to use. If it is -1, the environment is left
+        untouched.
+
+    Returns
+    -------
+    dict
+        The environment to pass to the simulation process.
+    """
+    if gpu_id not in _SIMULATION_ENVS:
+        env = os.environ.copy()
+        if gpu_id != -1:
+            env["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
+        _SIMULATION_ENVS[gpu_id] = env
+    return _SIMULATION_ENVS[gpu_id]
+
+
+def _init_worker(lock, run_flag, simulation_study):
+    """Initializes a pool worker.
+
+    Parameters
+    ----------
+    lock : multiprocessing.Lock
+        The lock to use when updating the simulation status. Native locks
+        cannot be pickled as task arguments, so they have to be inherited by
+        the workers at creation time.
+    run_flag : multiprocessing.Value
+        The shared run flag. When it is set to 0, the worker skips the
+        simulations it has not started yet.
+    simulation_study : SimulationStudy
+        The simulation study the simulations belong to. It is the same for
+        all the simulations, so it is pickled once per worker rather than
+        once per task.
+    """
+    global _STATUS_LOCK, _RUN_FLAG, _SIMULATION_STUDY
+    _STATUS_LOCK = lock
+    _RUN_FLAG = run_flag
+    _SIMULATION_STUDY = simulation_study
+
+
 def execute_command(
     command,
     folder_path,
     stdout_file,
     stderr_file,
     gpu_id,
-    simulation_info,
-    lock,
     simulation_study: SimulationStudy,
 ):
     """Executes a command.
@@ -47,57 +110,66 @@ def execute_command(
         The command to execute.
     folder_path : str
         The path to the folder where the command will be executed.
-    stdout_file : file
-        The file where the stdout will be redirected.
-    stderr_file : file
-        The file where the stderr will be redirected.
+    stdout_file : str
+        The path to the file where the stdout will be redirected.
+    stderr_file : str
+        The path to the file where the stderr will be redirected.
     gpu_id : int
         The ID of the GPU to use. If it is -1, the command will be executed on
         the CPU.
-    simulation_info : dict
-        The dictionary containing the simulation info. Composed of manager.list
-        objects, so it can be shared between processes.
-    lock : multiprocessing.Lock
-        The lock to use when updating the simulation info.
     simulation_study : SimulationStudy
         The simulation study.
     """
     # check if the run flag is set to 0
-    if simulation_info["run_flag"].value == 0:
+    if _RUN_FLAG.value == 0:
         print(f"Skipping simulation in folder {folder_path}...")
         return False
 
     # Set the CUDA_VISIBLE_DEVICES environment variable to the GPU ID
-    env = os.environ.copy()
-    if gpu_id != -1:
-        env["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
+    env = _simulation_env(gpu_id)
     simulation_name = os.path.basename(folder_path)
     # are we running the test sim?
     is_test = simulation_name == "test"
 
     # Update the simulation status
     if not is_test:
-        with lock:
+        with _STATUS_LOCK:
             simulation_study.set_sim_status(simulation_name, "running")
 
     # Execute the command using subprocess
     try:
-        stdout_file = open(stdout_file, "w", encoding="utf-8")
-        stderr_file = open(stderr_file, "w", encoding="utf-8")
         print(
             f"Running simulation in folder {folder_path}"
             + (f" on GPU {gpu_id}..." if gpu_id != -1 else "on CPU...")
         )
-        subprocess.run(
-            command,
-            stdout=stdout_file,
-            stderr=stderr_file,
-            env=env,
-            cwd=folder_path,
-            check=True,
-        )
-        stdout_file.close()
-        stderr_file.close()
+        # the files are only handed to the child process, so there is no need
+        # for a text layer and its buffer on top of them. They are opened only
+        # for the lifetime of the simulation and closed however it ends
+        with open(stdout_file, "wb", buffering=0) as stdout_f, open(
+            stderr_file, "wb", buffering=0
+        ) as stderr_f:
+            try:
+                subprocess.run(
+                    command,
+                    stdout=stdout_f,
+                    stderr=stderr_f,
+                    env=env,
+                    cwd=folder_path,
+                    check=True,
+                )
+            except OSError:
+                # the main file could not be executed directly, e.g. because
+                # the study is on a noexec mount, so it is passed to bash
+                if command[0] == "bash":
+                    raise
+                subprocess.run(
+                    ["bash"] + command,
+                    stdout=stdout_f,
+                    stderr=stderr_f,
+                    env=env,
+                    cwd=folder_path,
+                    check=True,
+                )
 
         # Assuming that the simulation is finished successfully
         # we have now to move the resulting files in the output folder
@@ -121,21 +193,19 @@ def execute_command(
             f"KeyboardInterrupt detected, stopping simulation in folder {folder_path}"
             + (f" on GPU {gpu_id}..." if gpu_id != -1 else "on CPU...")
         )
-        stdout_file.close()
-        stderr_file.close()
         # Update the simulation status
         if not is_test:
-            with lock:
+            with _STATUS_LOCK:
                 simulation_study.set_sim_status(simulation_name, "interrupted")
         return False
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         print(
             f"Error running simulation in folder {simulation_name}"
             + (f" on GPU {gpu_id}..." if gpu_id != -1 else "on CPU...")
         )
         # Update the simulation status
         if not is_test:
-            with lock:
+            with _STATUS_LOCK:
                 simulation_study.set_sim_status(simulation_name, "error")
         return False
     except Exception as e:
@@ -148,26 +218,26 @@ def execute_command(
         )
         # Update the simulation status once the simulation is finished
         if not is_test:
-            with lock:
+            with _STATUS_LOCK:
                 simulation_study.set_sim_status(simulation_name, "finished")
         return True
 
 
 def command_executor(args):
-    """Executes a command on a GPU.
+    """Executes a command on a GPU, with the simulation study of the worker.
 
     Parameters
     ----------
     args : tuple
-        The arguments to pass to the execute_command_on_gpu function.
+        The arguments to pass to the execute_command function, except for
+        the simulation study.
 
     Returns
     -------
-    int
-        The return code of the process.
+    bool
+        True if the simulation finished successfully, False otherwise.
     """
-    execute_command(*args)
-    return 0
+    return execute_command(*args, _SIMULATION_STUDY)
 
 
 def job_run_local(simulation_study: SimulationStudy, **kwargs):
@@ -228,107 +298,128 @@ def job_run_local(simulation_study: SimulationStudy, **kwargs):
         )
 
     # load the simulation info
-    simulation_info_file = os.path.join(sim_folder, "simulation_info.yaml")
-    with open(simulation_info_file, "r", encoding="utf-8") as f:
-        simulation_info = yaml.safe_load(f)
+    simulation_info = simulation_study._read_info()
 
     # get the list of simulations to run
     if run_test:
         simulations_to_run = ["test"]
     else:
-        simulations_to_run = simulation_info["sim_not_started"].copy()
+        sims_by_status = simulation_study._sims_by_status(simulation_info)
+        simulations_to_run = sims_by_status["not_started"]
+    # with nothing to run there is no worker pool to start
+    if not simulations_to_run:
+        print("No simulations to run.")
+        return
     # get the root folder
     root_folder = simulation_info["root_folder"]
 
-    # update the simulations' main file with run_local instructions
-    stdout_file_list = []
-    stderr_file_list = []
-
-    for i, sim in enumerate(simulations_to_run):
+    # build once all the paths needed for each simulation
+    paths = {}
+    for sim in simulations_to_run:
         folder_path = os.path.join(root_folder, "scan", sim)
-        main_file = os.path.join(folder_path, simulation_study.main_file)
+        paths[sim] = {
+            "folder": folder_path,
+            "main": os.path.join(folder_path, simulation_study.main_file),
+            "out": os.path.join(stdout_path, sim + ".out"),
+            "err": os.path.join(stderr_path, sim + ".err"),
+        }
+
+    # if the initial instructions start with a shebang, the main files are
+    # made executable and launched directly, sparing a bash process per
+    # simulation, otherwise they are passed to bash
+    direct_execution = initial_instructions.startswith("#!")
+    # simulations whose main file could not be made executable, which are
+    # passed to bash as well
+    not_executable = set()
+
+    def simulation_command(sim):
+        if direct_execution and sim not in not_executable:
+            return [paths[sim]["main"]]
+        return ["bash", paths[sim]["main"]]
+
+    # update the simulations' main file with run_local instructions
+    def patch_main_file(sim):
+        main_file = paths[sim]["main"]
 
         with open(main_file, "r", encoding="utf-8") as f:
             main_file_content = f.read()
 
-        # clean the main file from the templates
-        main_file_content = clean_script_from_templates(main_file_content)
+        # if the main file is already wrapped with the very same instructions
+        # (e.g. when re-running after some failures), there is no need to
+        # write it again
+        if not (
+            main_file_content.startswith(initial_instructions)
+            and main_file_content.endswith(final_instructions)
+        ):
+            # clean the main file from the templates
+            main_file_content = clean_script_from_templates(main_file_content)
+
+            main_file_content = (
+                initial_instructions
+                + "\n"
+                + main_file_content
+                + "\n"
+                + final_instructions
+            )
 
-        main_file_content = (
-            initial_instructions + "\n" + main_file_content + "\n" + final_instructions
-        )
+            write_file_atomically(main_file, main_file_content)
 
-        with open(main_file, "w", encoding="utf-8") as f:
-            f.write(main_file_content)
+        if direct_execution:
+            try:
+                os.chmod(main_file, os.stat(main_file).st_mode | 0o111)
+            except OSError:
+                not_executable.add(sim)
 
-        # stdout_file_list.append(
-        #     open(os.path.join(stdout_path, sim + ".out"), "w", encoding="utf-8")
-        # )
-        # stderr_file_list.append(
-        #     open(os.path.join(stderr_path, sim + ".err"), "w", encoding="utf-8")
-        # )
+    with ThreadPoolExecutor(max_workers=IO_POOL_WORKERS) as executor:
+        list(executor.map(patch_main_file, simulations_to_run))
 
     # run the simulations in parallel
     n_gpu_available = len(gpu_available_list)
 
     if n_gpu_available == 0:
-        for i, sim in enumerate(simulations_to_run):
-            stdout_file_list.append(os.path.join(stdout_path, sim + ".out"))
-            stderr_file_list.append(os.path.join(stderr_path, sim + ".err"))
-
-        manager = Manager()
-        shared_sim_status = {
-            "sim_not_started": manager.list(simulation_info["sim_not_started"]),
-            "sim_finished": manager.list(simulation_info["sim_finished"]),
-            "sim_interrupted": manager.list(simulation_info["sim_interrupted"]),
-            "sim_error": manager.list(simulation_info["sim_error"]),
-            "sim_running": manager.list(simulation_info["sim_running"]),
-            "run_flag": manager.Value("i", 1),
-        }
-        print("Sims to start:", shared_sim_status["sim_not_started"])
-        lock = manager.Lock()
+        # the workers only need to know whether to keep starting simulations,
+        # the status of each simulation is kept by the simulation study
+        run_flag = Value("i", 1, lock=False)
+        print("Sims to start:", simulations_to_run)
+        lock = Lock()
 
         argmunet_list = []
-        for i, sim in enumerate(simulations_to_run):
-            folder_path = os.path.join(root_folder, "scan", sim)
-            main_file = os.path.join(folder_path, simulation_study.main_file)
-
+        for sim in simulations_to_run:
             argmunet_list.append(
                 (
-                    [
-                        "bash",
-                        os.path.join(
-                            root_folder, "scan", sim, simulation_study.main_file
-                        ),
-                    ],
-                    os.path.join(root_folder, "scan", sim),
-                    stdout_file_list[i],
-                    stderr_file_list[i],
+                    simulation_command(sim),
+                    paths[sim]["folder"],
+                    paths[sim]["out"],
+                    paths[sim]["err"],
                     -1,
-                    shared_sim_status,
-                    lock,
-                    simulation_study,
                 )
             )
         try:
             starting_time = datetime.now()
             print("Running simulations...")
             n_concurrent_jobs = min(n_concurrent_jobs, len(argmunet_list))
-            pool = Pool(n_concurrent_jobs)
-            result = pool.map_async(command_executor, argmunet_list)
+            pool = Pool(
+                n_concurrent_jobs,
+                initializer=_init_worker,
+                initargs=(lock, run_flag, simulation_study),
+            )
+            # hand out one simulation at a time, so that a free worker picks
+            # up the next simulation right away, and collect the outcomes in
+            # order of completion rather than in order of submission
+            results = pool.imap_unordered(command_executor, argmunet_list)
             pool.close()
             print(f"Started running at {starting_time}...")
-            result.get()
+            for n_completed, _ in enumerate(results, start=1):
+                print(f"Completed {n_completed}/{len(argmunet_list)} simulations...")
         except KeyboardInterrupt:
             print(
                 "KeyboardInterrupt detected, wait for running simulations to finish gracefully..."
             )
             # set the run flag to 0
             with lock:
-                shared_sim_status["run_flag"].value = 0
+                run_flag.value = 0
 
             try:
-                result.get()
                 pool.join()
             except KeyboardInterrupt:
                 print("Ok then, force stop the simulations...")
@@ -350,21 +441,9 @@ def job_run_local(simulation_study: SimulationStudy, **kwargs):
         # This way, we can run multiple simulations in parallel, but each
         # simulation will use only one GPU. With no risk of running two or more
         # simulations on the same GPU.
-        for i, sim in enumerate(simulations_to_run):
-            stdout_file_list.append(os.path.join(stdout_path, sim + ".out"))
-            stderr_file_list.append(os.path.join(stderr_path, sim + ".err"))
-
-        manager = Manager()
-        shared_sim_status = {
-            "sim_not_started": manager.list(simulation_info["sim_not_started"]),
-            "sim_finished": manager.list(simulation_info["sim_finished"]),
-            "sim_interrupted": manager.list(simulation_info["sim_interrupted"]),
-            "sim_error": manager.list(simulation_info["sim_error"]),
-            "sim_running": manager.list(simulation_info["sim_running"]),
-            "run_flag": manager.Value("i", 1),
-        }
-        print("Shared simulation status:", shared_sim_status["sim_not_started"])
-        lock = manager.Lock()
+        run_flag = Value("i", 1, lock=False)
+        print("Sims to start:", simulations_to_run)
+        lock = Lock()
 
         argument_dict = {i: [] for i in gpu_available_list}
 
@@ -372,19 +451,11 @@ def job_run_local(simulation_study: SimulationStudy, **kwargs):
             gpu_idx = i % n_gpu_available
             argument_dict[gpu_available_list[gpu_idx]].append(
                 (
-                    [
-                        "bash",
-                        os.path.join(
-                            root_folder, "scan", sim, simulation_study.main_file
-                        ),
-                    ],
-                    os.path.join(root_folder, "scan", sim),
-                    stdout_file_list[i],
-                    stderr_file_list[i],
+                    simulation_command(sim),
+                    paths[sim]["folder"],
+                    paths[sim]["out"],
+                    paths[sim]["err"],
                     gpu_available_list[gpu_idx],
-                    shared_sim_status,
-                    lock,
-                    simulation_study,
                 )
             )
 
@@ -394,12 +465,31 @@ def job_run_local(simulation_study: SimulationStudy, **kwargs):
             print("Running simulations...")
             print(f"Started running at {starting_time}...")
             pool_list = []
+            result_list = []
             for key in argument_dict.keys():
-                pool_list.append(Pool(1))
-                pool_list[-1].map_async(command_executor, argument_dict[key])
+                pool_list.append(
+                    Pool(
+                        1,
+                        initializer=_init_worker,
+                        initargs=(lock, run_flag, simulation_study),
+                    )
+                )
+                # the pool has a single worker, so sending the jobs in chunks
+                # only saves dispatch round trips
+                result_list.append(
+                    pool_list[-1].map_async(
+                        command_executor,
+                        argument_dict[key],
+                        chunksize=max(1, len(argument_dict[key]) // 8),
+                    )
+                )
                 print(f"Created a pool with {len(argument_dict[key])} jobs...")
             for pool in pool_list:
                 pool.close()
+            # wait for the results, so that errors raised in the workers
+            # are propagated here instead of being silently discarded
+            for result in result_list:
+                result.get()
             # join the pools
             for pool in pool_list:
                 pool.join()
@@ -410,15 +500,16 @@ def job_run_local(simulation_study: SimulationStudy, **kwargs):
             )
             # set the run flag to 0
             with lock:
-                shared_sim_status["run_flag"].value = 0
+                run_flag.value = 0
 
             try:
-                result.get()
-                pool.join()
+                for pool in pool_list:
+                    pool.join()
             except KeyboardInterrupt:
                 print("Ok then! Force stop the simulations...")
-                pool.terminate()
-                pool.join()
+                for pool in pool_list:
+                    pool.terminate()
+                    pool.join()
         except Exception as e:
             print("Unexpected error:", e)
             raise e
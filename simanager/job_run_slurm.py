@@ -1,12 +1,9 @@
 import os
-import re
 import subprocess
 from datetime import datetime
 
-import yaml
-
 from .simulation_study import SimulationStudy
-from .tools import clean_script_from_templates
+from .tools import PlaceholderTemplate, clean_script_from_templates
 
 INSTRUCTIONS_SLURM_DEFAULT = """#!/bin/bash
 
@@ -18,9 +15,7 @@ INSTRUCTIONS_SLURM_DEFAULT = """#!/bin/bash
 #SBATCH --ntasks=1
 #SBATCH --cpus-per-task=__REPLACE_WITH_REQUEST_CPUS__
 #SBATCH --mem=__REPLACE_WITH_REQUEST_MEM__
-#SBATCH --gres=__REPLACE_WITH_REQUEST_GPUS__
-#SBATCH --partition=__REPLACE_WITH_PARTITION__
-
+__REPLACE_WITH_OPTIONAL_DIRECTIVES__
 # initial instructions
 # set simpath
 SIMPATH=$1
@@ -57,23 +52,16 @@ fi
 
 SUBMISSION_SLURM_DEFAULT = """#!/bin/bash
 
-# Define three lists as arrays
-SIMPATHS=__REPLACE_WITH_SIMPATHS__
-OUTPATHS=__REPLACE_WITH_OUTPATHS__
-ERRPATHS=__REPLACE_WITH_ERRPATHS__
-
-# Calculate the length of one of the lists (assuming all lists have the same length)
-length=${#SIMPATHS[@]}
-
-# Iterate over the indices of the arrays
-for ((i = 0; i < length; i++)); do
-    SIM=${SIMPATHS[i]}
-    OUT=${OUTPATHS[i]}
-    ERR=${ERRPATHS[i]}
+# Files listing the simulation, stdout and stderr paths, one line per job
+SIMPATHS="__REPLACE_WITH_SIMPATHS_FILE__"
+OUTPATHS="__REPLACE_WITH_OUTPATHS_FILE__"
+ERRPATHS="__REPLACE_WITH_ERRPATHS_FILE__"
 
+# Iterate over the lines of the three files at the same time
+while IFS= read -r SIM <&3 && IFS= read -r OUT <&4 && IFS= read -r ERR <&5; do
     # submit the job
-    sbatch __REPLACE_WITH_SLURM_SUBMIT_FILE__ $SIM __REPLACE_WITH_MAINFILE__ $OUT $ERR
-done
+    sbatch __REPLACE_WITH_SLURM_SUBMIT_FILE__ "$SIM" __REPLACE_WITH_MAINFILE__ "$OUT" "$ERR"
+done 3< "$SIMPATHS" 4< "$OUTPATHS" 5< "$ERRPATHS"
 
 """
 
@@ -162,51 +150,37 @@ def job_run_slurm(simulation_study: SimulationStudy, **kwargs):
     slurm_support_folder = os.path.join(sim_folder, "slurm_support")
     os.makedirs(slurm_support_folder, exist_ok=True)
 
-    # specialization of the SLURM file
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_JOB_NAME__", simulation_study.study_name
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_SLURM_OUT_PATH__", stdout_path_slurm
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_SLURM_ERR_PATH__", stderr_path_slurm
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_REQUEST_CPUS__", str(request_cpus)
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_REQUEST_MEM__", str(request_ram) + "G"
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_TIME_LIMIT__", time_limit
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_VENV_PATH__", venv_path
-    )
-    slurm_instructions = slurm_instructions.replace(
-        "__REPLACE_WITH_MAIN_FILE__", simulation_study.main_file
-    )
-
+    # specialization of the SLURM file, the optional directives are either
+    # full lines or nothing at all
+    optional_directives = ""
     if request_gpus:
-        slurm_instructions = slurm_instructions.replace(
-            "__REPLACE_WITH_REQUEST_GPUS__", "gpu:1"
-        )
-    else:
-        # remove the entire line where the gres is specified
-        slurm_instructions = re.sub(
-            r"#SBATCH --gres=__REPLACE_WITH_REQUEST_GPUS__\n", "", slurm_instructions
-        )
-
+        optional_directives += "#SBATCH --gres=gpu:1\n"
     if partition_option != "":
+        optional_directives += f"#SBATCH --partition={partition_option}\n"
+    # custom instructions may still have the gres and partition directives
+    # on lines of their own, which are removed when they do not apply
+    if not request_gpus:
         slurm_instructions = slurm_instructions.replace(
-            "__REPLACE_WITH_PARTITION__", partition_option
+            "#SBATCH --gres=__REPLACE_WITH_REQUEST_GPUS__\n", ""
         )
-    else:
-        # remove the entire line where the partition is specified
-        slurm_instructions = re.sub(
-            r"#SBATCH --partition=__REPLACE_WITH_PARTITION__\n", "", slurm_instructions
+    if partition_option == "":
+        slurm_instructions = slurm_instructions.replace(
+            "#SBATCH --partition=__REPLACE_WITH_PARTITION__\n", ""
         )
+    # unknown placeholders of custom instructions are left untouched
+    slurm_instructions = PlaceholderTemplate(slurm_instructions).safe_substitute(
+        JOB_NAME=simulation_study.study_name,
+        SLURM_OUT_PATH=stdout_path_slurm,
+        SLURM_ERR_PATH=stderr_path_slurm,
+        REQUEST_CPUS=str(request_cpus),
+        REQUEST_MEM=str(request_ram) + "G",
+        TIME_LIMIT=time_limit,
+        VENV_PATH=venv_path,
+        MAIN_FILE=simulation_study.main_file,
+        REQUEST_GPUS="gpu:1",
+        PARTITION=partition_option,
+        OPTIONAL_DIRECTIVES=optional_directives,
+    )
 
     # save the SLURM file
     slurm_submit_file = os.path.join(
@@ -217,56 +191,55 @@ def job_run_slurm(simulation_study: SimulationStudy, **kwargs):
         f.write(slurm_instructions)
 
     # load the simulation info
-    simulation_info_file = os.path.join(
-        simulation_study.study_path, simulation_study.study_name, "simulation_info.yaml"
-    )
-    with open(simulation_info_file, "r", encoding="utf-8") as f:
-        simulation_info = yaml.safe_load(f)
+    simulation_info = simulation_study._read_info()
 
     # get the list of simulations to run
     if run_test:
         simulations_to_run = ["test"]
     else:
-        simulations_to_run = simulation_info["sim_not_started"]
+        sims_by_status = simulation_study._sims_by_status(simulation_info)
+        simulations_to_run = sims_by_status["not_started"]
     # get the root folder
     root_folder = simulation_info["root_folder"]
 
+    scan_folder = os.path.join(root_folder, "scan")
     queue_simpath_list = []
     queue_outpath_list = []
     queue_errpath_list = []
     for sim in simulations_to_run:
-        folder_path = os.path.join(root_folder, "scan", sim)
-
-        queue_simpath_list.append(folder_path)
+        queue_simpath_list.append(os.path.join(scan_folder, sim))
         queue_outpath_list.append(os.path.join(stdout_path, sim + ".out"))
         queue_errpath_list.append(os.path.join(stderr_path, sim + ".err"))
 
-        print(f"Added {sim} to the queue file")
-
     print("Total number of jobs:", len(simulations_to_run))
 
-    # specialize the submission file
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_SIMPATHS__",
-        "(" + " ".join([f'"{s}"' for s in queue_simpath_list]) + ")",
-    )
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_OUTPATHS__",
-        "(" + " ".join([f'"{s}"' for s in queue_outpath_list]) + ")",
-    )
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_ERRPATHS__",
-        "(" + " ".join([f'"{s}"' for s in queue_errpath_list]) + ")",
-    )
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_MAIN_FILE__", simulation_study.main_file
-    )
+    submit_placeholders = {
+        "SLURM_SUBMIT_FILE": slurm_submit_file,
+        "MAINFILE": simulation_study.main_file,
+        "MAIN_FILE": simulation_study.main_file,
+    }
+    # save the paths in three queue files, one line per job, read by the
+    # submission file (embedding them in the script as bash arrays makes
+    # it slow to parse and can exceed the shell limits for large studies)
+    for name, queue_list in (
+        ("SIMPATHS", queue_simpath_list),
+        ("OUTPATHS", queue_outpath_list),
+        ("ERRPATHS", queue_errpath_list),
+    ):
+        queue_file = os.path.join(slurm_support_folder, name.lower() + ".txt")
+        with open(queue_file, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in queue_list))
+        submit_placeholders[name + "_FILE"] = queue_file
+        # custom submission templates written for the former bash arrays
+        # still get the quoted arrays
+        if f"__REPLACE_WITH_{name}__" in slurm_submit_template:
+            submit_placeholders[name] = (
+                "(" + " ".join(f'"{line}"' for line in queue_list) + ")"
+            )
 
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_SLURM_SUBMIT_FILE__", slurm_submit_file
-    )
-    slurm_submit_template = slurm_submit_template.replace(
-        "__REPLACE_WITH_MAINFILE__", simulation_study.main_file
+    # specialize the submission file
+    slurm_submit_template = PlaceholderTemplate(slurm_submit_template).safe_substitute(
+        submit_placeholders
     )
 
     # save the submission file
@@ -4,6 +4,8 @@ from dataclasses import dataclass
 import numpy as np
 import yaml
 
+from .tools import YamlLoader
+
 
 @dataclass
 class ParameterInspection:
@@ -85,7 +87,7 @@ class ParameterInspection:
     @classmethod
     def from_yaml(cls, yaml_path: str):
         with open(yaml_path, "r", encoding="utf-8") as f:
-            dictionary = yaml.safe_load(f)
+            dictionary = yaml.load(f, Loader=YamlLoader)
         return cls.from_dict(dictionary)
 
     def __post_init__(self):
@@ -94,8 +96,9 @@ class ParameterInspection:
                 raise ValueError(
                     "If inspection_method is range, min_value and max_value must be specified."
                 )
-            self.values = list(np.arange(self.min_value, self.max_value))
-            self.values = [self._force_type(v, int) for v in self.values]
+            self.values = self._force_type_array(
+                np.arange(self.min_value, self.max_value), int
+            )
         elif self.inspection_method == "linspace":
             if not (
                 self.min_value is not None
@@ -105,10 +108,9 @@ class ParameterInspection:
                 raise ValueError(
                     "If inspection_method is linspace, min_value, max_value, and n_samples must be specified."
                 )
-            self.values = list(
-                np.linspace(self.min_value, self.max_value, self.n_samples)
+            self.values = self._force_type_array(
+                np.linspace(self.min_value, self.max_value, self.n_samples), float
             )
-            self.values = [self._force_type(v, float) for v in self.values]
         elif self.inspection_method == "logspace":
             if not (
                 self.min_value is not None
@@ -118,12 +120,12 @@ class ParameterInspection:
                 raise ValueError(
                     "If inspection_method is logspace, min_value, max_value, and n_samples must be specified."
                 )
-            self.values = list(
+            self.values = self._force_type_array(
                 np.logspace(
                     np.log10(self.min_value), np.log10(self.max_value), self.n_samples
-                )
+                ),
+                float,
             )
-            self.values = [self._force_type(v, float) for v in self.values]
         elif self.inspection_method == "custom":
             if not self.values is not None:
                 raise ValueError(
@@ -142,6 +144,14 @@ class ParameterInspection:
             else:
                 self.parameter_file_name = self.parameter_name
 
+    def _force_type_array(self, values, default):
+        # numerical types are forced on the whole array at once, and the
+        # values are converted to Python scalars in a single call
+        if self.force_type is None or self.force_type in ("int", "float"):
+            dtype = {"int": int, "float": float}.get(self.force_type, default)
+            return values.astype(dtype).tolist()
+        return [self._force_type(v, default) for v in values]
+
     def _force_type(self, value, default):
         if self.force_type == "int":
             return int(value)
@@ -1,25 +1,48 @@
+import copy
+import json
+import math
 import os
 import pickle
 import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict, dataclass, field
-from itertools import product
-import pandas as pd
+from functools import lru_cache
+from itertools import chain, product
 
 import numpy as np
 import yaml
 
 from .parameter_inspection import ParameterInspection
 from .tools import (
+    IO_POOL_WORKERS,
+    YamlDumper,
+    YamlLoader,
     clone_folder_content,
+    copy_nested_dict_paths,
+    dump_config,
     number_filename_formatter,
-    float_representer,
-    int_representer,
-    numpy_scalar_representer,
-    update_nested_dict,
+    restore_folder_content,
+    scan_folder_content,
+    update_nested_dict_parts,
+    write_file_atomically,
     flatten_dict,
-    insert_nested_dict_in_dataframe,
+    make_yaml_renderer,
+    rows_to_dataframe,
 )
 
+# the possible statuses of a simulation
+SIM_STATUSES = ("not_started", "running", "finished", "interrupted", "error")
+
+
+@lru_cache(maxsize=32)
+def _load_study_file(simulation_study_file, file_key):
+    """Parses a simulation study file. The (inode, modification time, size)
+    of the file is part of the cache key, as for the simulation info, so that
+    the file is parsed again whenever it changes."""
+    with open(simulation_study_file, "r", encoding="utf-8") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
 
 @dataclass
 class SimulationStudy:
@@ -65,6 +88,13 @@ class SimulationStudy:
     folders_created: bool = False
 
     def __post_init__(self):
+        # parameter combinations, with the key they were built for, set by
+        # build_parameter_combinations
+        self._combinations_cache = None
+        # content of simulation_info.json, with the (inode, mtime, size) of the
+        # file it was read from, set by _read_info and _write_info
+        self._info_cache = None
+
         # if self.study_path == "./":
         self.study_path = os.path.abspath(self.study_path)
 
@@ -92,12 +122,6 @@ class SimulationStudy:
             for k, v in self.environ_dict.items():
                 os.environ[k] = v
 
-        # Register the custom representers for numerical types
-        yaml.add_representer(int, int_representer)
-        yaml.add_representer(float, float_representer)
-        yaml.add_representer(np.int64, numpy_scalar_representer)
-        yaml.add_representer(np.float64, numpy_scalar_representer)
-
     @classmethod
     def load_folder(cls, folder_path: str):
         """Loads a simulation study from a folder.
@@ -113,8 +137,15 @@ class SimulationStudy:
             The simulation study.
         """
         simulation_study_file = os.path.join(folder_path, "simulation_study.yaml")
-        with open(simulation_study_file, "r", encoding="utf-8") as f:
-            simulation_study = yaml.safe_load(f)
+        # the parsed file is cached, and a copy is handed out as the
+        # constructor modifies it
+        stat = os.stat(simulation_study_file)
+        simulation_study = copy.deepcopy(
+            _load_study_file(
+                simulation_study_file,
+                (stat.st_ino, stat.st_mtime_ns, stat.st_size),
+            )
+        )
         simulation_study["study_path"] = folder_path
         return cls(**simulation_study)
 
@@ -127,18 +158,28 @@ class SimulationStudy:
             List of tuples, where each tuple contains the name of the parameter,
             the filename version of the parameter name, the value of the
             parameter, the number of values of the parameter, and the type of
-            combination (single or multi).
+            combination (single or multi). The list is cached, and built again
+            only if the parameters inspected change.
         """
+        # the repr of the dataclasses covers every field, so any change in the
+        # parameters inspected invalidates the cached combinations
+        cache_key = repr(self.parameters_inspected)
+        if self._combinations_cache is not None:
+            if self._combinations_cache[0] == cache_key:
+                return self._combinations_cache[1]
+
         p_names = [p.parameter_name for p in self.parameters_inspected]
         p_values = [p.values for p in self.parameters_inspected]
-        p_idx = np.array([p.combination_idx for p in self.parameters_inspected])
-        p_combo_methods = np.array(
-            [p.combination_method for p in self.parameters_inspected]
-        )
+        p_combo_methods = [p.combination_method for p in self.parameters_inspected]
         p_file_names = [p.parameter_file_name for p in self.parameters_inspected]
 
+        # group the parameters by combination index, -1 meaning not combined
+        p_groups = defaultdict(list)
+        for idx, p in enumerate(self.parameters_inspected):
+            p_groups[p.combination_idx].append(idx)
+
         single_combinations = []
-        for idx in np.where(p_idx == -1)[0]:
+        for idx in p_groups.pop(-1, []):
             single_combinations.append(
                 (
                     p_names[idx],
@@ -149,16 +190,15 @@ class SimulationStudy:
                 )
             )
 
-        unique_idx = np.unique(p_idx[p_idx != -1])
         joined_combinations = []
-        for val in unique_idx:
-            idxs = np.where(p_idx == val)[0]
+        for val in sorted(p_groups):
+            idxs = p_groups[val]
             names = [p_names[idx] for idx in idxs]
             file_names = [p_file_names[idx] for idx in idxs]
             values = [p_values[idx] for idx in idxs]
             combo_method = p_combo_methods[idxs[0]]
             # check if all combo methods with same idx are the same
-            if not all(p_combo_methods[idxs] == combo_method):
+            if not all(p_combo_methods[idx] == combo_method for idx in idxs):
                 raise ValueError(
                     "All combination methods with the same idx must be the same."
                 )
@@ -176,12 +216,18 @@ class SimulationStudy:
                     (names, file_names, vv, len(vv), "multi", id_equiv)
                 )
             elif combo_method == "meshgrid":
-                vv = np.meshgrid(*values)
-                vv = [v.flatten().tolist() for v in vv]
-                id_equiv = np.meshgrid(*[range(len(v)) for v in values])
-                id_equiv = [v.flatten().tolist() for v in id_equiv]
-                vv = list(zip(*vv))
-                id_equiv = list(zip(*id_equiv))
+                # enumerate the points of the grid in the same order as the
+                # flattened np.meshgrid(*values), whose default "xy" indexing
+                # swaps the first two axes, without building the dense grids
+                axes = [np.asarray(v).tolist() for v in values]
+                order = list(range(len(axes)))
+                if len(order) > 1:
+                    order[0], order[1] = 1, 0
+                id_equiv = [
+                    tuple(point[j] for j in order)
+                    for point in product(*[range(len(axes[j])) for j in order])
+                ]
+                vv = [tuple(axis[i] for axis, i in zip(axes, idx)) for idx in id_equiv]
                 joined_combinations.append(
                     (names, file_names, vv, len(vv), "multi", id_equiv)
                 )
@@ -195,6 +241,7 @@ class SimulationStudy:
                 )
 
         combinations = single_combinations + joined_combinations
+        self._combinations_cache = (cache_key, combinations)
         return combinations
 
     def yield_parameter_combinations(self):
@@ -209,12 +256,13 @@ class SimulationStudy:
             parameter, and the type of combination (single or multi).
         """
         combinations = self.build_parameter_combinations()
-        n_values = np.array([c[3] for c in combinations], dtype=int)
-        current_idx = np.zeros(len(n_values), dtype=int)
-        total_combinations = np.prod([c[3] for c in combinations])
-        print(f"Total number of parameter combinations: {total_combinations}")
 
-        for _ in range(total_combinations):
+        # the first parameter is the one varying the fastest, while
+        # itertools.product varies the last one the fastest, hence the
+        # reversed axes
+        axes = [range(c[3]) for c in reversed(combinations)]
+        for reversed_idx in product(*axes):
+            current_idx = reversed_idx[::-1]
             # get the current combination
             current_combination = []
             for j, c in enumerate(combinations):
@@ -233,15 +281,6 @@ class SimulationStudy:
                                 c[5][current_idx[j]][k],
                             )
                         )
-            # update the indices
-            current_idx[0] += 1
-            for i, (idx, max_val) in enumerate(zip(current_idx, n_values)):
-                if idx == max_val:
-                    current_idx[i] = 0
-                    if i + 1 < len(current_idx):
-                        current_idx[i + 1] += 1
-                    else:
-                        pass
 
             yield current_combination
 
@@ -255,119 +294,173 @@ class SimulationStudy:
 
         os.makedirs(os.path.join(main_folder, "output_files"), exist_ok=True)
         os.makedirs(os.path.join(main_folder, "remote_touch_files"), exist_ok=True)
-        os.makedirs(os.path.join(main_folder, "original_folder"), exist_ok=True)
+        # paths used over and over in the loop below
+        scan_folder = os.path.join(main_folder, "scan")
+        original_folder_copy = os.path.join(main_folder, "original_folder")
+        config_file = self.config_file
+
+        os.makedirs(original_folder_copy, exist_ok=True)
         # clone the original folder content
-        clone_folder_content(
-            self.original_folder, os.path.join(main_folder, "original_folder")
-        )
+        clone_folder_content(self.original_folder, original_folder_copy)
 
         simulation_info = {}
         # write the complete path of the main folder
         simulation_info["root_folder"] = os.path.abspath(main_folder)
-        simulation_info["sim_not_started"] = []
-        simulation_info["sim_finished"] = []
-        simulation_info["sim_interrupted"] = []
-        simulation_info["sim_error"] = []
-        simulation_info["sim_running"] = []
-
-        # create a folder for each parameter combination
-        simulation_combos = {}
-        for i, combination in enumerate(self.yield_parameter_combinations()):
-            str_blocks = [
-                c[1] + "_" + number_filename_formatter(c[2], c[4])
-                for c in combination
-                if c[1] is not None
-            ]
-            foldername = "case_" + "_".join(str_blocks)
-            folder_path = os.path.join(main_folder, "scan", foldername)
+        # status of every simulation, indexed by simulation name
+        simulation_info["status"] = {}
+
+        # the parameter file is the same for every folder before the update,
+        # so it is parsed only once and copied for each combination
+        with open(
+            os.path.join(original_folder_copy, config_file), "r", encoding="utf-8"
+        ) as f:
+            template_parameters = yaml.load(f, Loader=YamlLoader)
+
+        # the content to clone is the same for every folder, so it is listed
+        # only once, the parameter file is written separately
+        original_content = scan_folder_content(
+            original_folder_copy, exclude=(config_file,)
+        )
+
+        def create_folder(folder_path, parameters, parameters_text=None):
             os.makedirs(folder_path, exist_ok=True)
             clone_folder_content(
-                os.path.join(main_folder, "original_folder"), folder_path
+                original_folder_copy, folder_path, folder_content=original_content
             )
+            # save the parameter file
+            parameter_file = os.path.join(folder_path, config_file)
+            if parameters_text is None:
+                dump_config(parameters, parameter_file)
+            else:
+                with open(parameter_file, "w", encoding="utf-8") as f:
+                    f.write(parameters_text)
 
-            # open the parameter file and update the parameters
-            parameter_file = os.path.join(folder_path, self.config_file)
-            with open(parameter_file, "r", encoding="utf-8") as f:
-                parameters = yaml.safe_load(f)
+        # create a folder for each parameter combination, while the
+        # combinations are enumerated
+        total_combinations = math.prod(
+            c[3] for c in self.build_parameter_combinations()
+        )
+        print(f"Total number of parameter combinations: {total_combinations}")
+        futures = []
+        name_blocks = {}
+        dataframe_rows = []
+        with ThreadPoolExecutor(max_workers=IO_POOL_WORKERS) as executor:
+            for i, combination in enumerate(self.yield_parameter_combinations()):
+                foldername = self._combination_folder_name(combination, name_blocks)
+                folder_path = os.path.join(scan_folder, foldername)
+
+                # every combination sets the same parameters in the same
+                # order, so their names are split only once
+                if i == 0:
+                    key_parts = [c[0].split("/") for c in combination]
+                    # if the parameters are all leaves of the template, the
+                    # rows of the DataFrame are the flattened template with
+                    # the values of the combination, no need to flatten
+                    # every set of parameters again
+                    template_row = flatten_dict(template_parameters)
+                    patch_rows = all(c[0] in template_row for c in combination)
+                    # YAML parameter files are rendered once with placeholders
+                    # for the values of the combinations, written in place
+                    # when possible instead of dumping every file
+                    render_parameters = None
+                    if not config_file.endswith(".json"):
+                        render_parameters = make_yaml_renderer(
+                            {**template_parameters, "simulation_status": "not_started"},
+                            key_parts,
+                        )
 
-            for c in combination:
-                update_nested_dict(parameters, c[0], c[2])
+                # update the parameters, on a copy of the template sharing
+                # everything but the dictionaries holding the updated values
+                parameters = copy_nested_dict_paths(template_parameters, key_parts)
 
-            parameters["simulation_status"] = "not_started"
-            simulation_info["sim_not_started"].append(foldername)
-            # save the parameter file
-            with open(parameter_file, "w", encoding="utf-8") as f:
-                yaml.dump(parameters, f)
-
-            # save the combination info
-            simulation_combos[foldername] = combination
-
-            if i == 0:
-                # create the test case folder
-                folder_path = os.path.join(main_folder, "scan", "test")
-                os.makedirs(folder_path, exist_ok=True)
-                clone_folder_content(
-                    os.path.join(main_folder, "original_folder"), folder_path
+                for keys, c in zip(key_parts, combination):
+                    update_nested_dict_parts(parameters, keys, c[2])
+
+                parameters["simulation_status"] = "not_started"
+                simulation_info["status"][foldername] = "not_started"
+                parameters_text = None
+                if render_parameters is not None:
+                    parameters_text = render_parameters([c[2] for c in combination])
+                futures.append(
+                    executor.submit(
+                        create_folder, folder_path, parameters, parameters_text
+                    )
                 )
-                # open the parameter file and update the parameters
-                parameter_file = os.path.join(folder_path, self.config_file)
-                with open(parameter_file, "r", encoding="utf-8") as f:
-                    parameters = yaml.safe_load(f)
 
-                for c in combination:
-                    update_nested_dict(parameters, c[0], c[2])
+                if i == 0:
+                    # create the test case folder
+                    folder_path = os.path.join(scan_folder, "test")
+                    # update the parameters
+                    test_key_parts = [key.split("/") for key in self.test_case]
+                    parameters = copy_nested_dict_paths(
+                        template_parameters, key_parts + test_key_parts
+                    )
 
-                # extra specifications for test case
-                for key, item in self.test_case.items():
-                    update_nested_dict(parameters, key, item)
+                    for keys, c in zip(key_parts, combination):
+                        update_nested_dict_parts(parameters, keys, c[2])
 
-                # save the parameter file
-                with open(parameter_file, "w", encoding="utf-8") as f:
-                    yaml.dump(parameters, f)
-
-                print("Test case folder created at: ", folder_path)
-
-                # create the information DataFrame
-                keys_for_df = list(flatten_dict(parameters).keys())
-                # add extra columns for the folder name and output path
-                keys_for_df += ["folder_name", "output_path"]
-                dataframe_info = pd.DataFrame(columns=keys_for_df)
-            
-            # make the extra_dict with the folder name and output path
-            extra_dict = {
-                "folder_name": foldername,
-                "output_path": os.path.join(self.output_path, foldername),
-            }
-            # add a row to the dataframe
-            dataframe_info = insert_nested_dict_in_dataframe(
-                dataframe_info, parameters, extra_dict
-            )
+                    # extra specifications for test case
+                    for keys, item in zip(test_key_parts, self.test_case.values()):
+                        update_nested_dict_parts(parameters, keys, item)
+
+                    futures.append(
+                        executor.submit(create_folder, folder_path, parameters)
+                    )
+
+                    print("Test case folder created at: ", folder_path)
+
+                    # columns of the information DataFrame
+                    keys_for_df = list(flatten_dict(parameters).keys())
+                    # add extra columns for the folder name and output path
+                    keys_for_df += ["folder_name", "output_path"]
+
+                # make the extra_dict with the folder name and output path
+                extra_dict = {
+                    "folder_name": foldername,
+                    "output_path": os.path.join(self.output_path, foldername),
+                }
+                # collect the rows, the DataFrame is built once at the end, as
+                # growing it row by row copies it every time
+                if i > 0 and patch_rows:
+                    row = dict(template_row)
+                    for c in combination:
+                        # a dictionary value would be flattened in more columns
+                        if isinstance(c[2], dict):
+                            row = flatten_dict(parameters)
+                            break
+                        row[c[0]] = c[2]
+                    else:
+                        row["simulation_status"] = "not_started"
+                else:
+                    row = flatten_dict(parameters)
+                dataframe_rows.append({**row, **extra_dict})
+
+            # wait for all the folders, raising here any error from the threads
+            for future in futures:
+                future.result()
 
         # count the final number of folders created
-        n_folders = len(os.listdir(os.path.join(main_folder, "scan")))
+        n_folders = len(os.listdir(scan_folder))
         print(f"Number of folders created: {n_folders}")
         # print the number of folders that were expected
-        print(f"Number of folders expected: {len(simulation_combos) + 1}")
+        n_expected = len(simulation_info["status"]) + 1
+        print(f"Number of folders expected: {n_expected}")
         # if the number of folders created is different from the expected, raise a warning
-        if n_folders != len(simulation_combos) + 1:
+        if n_folders != n_expected:
             print(
                 "WARNING: The number of folders created is different from the expected."
             )
 
         # save the master parameters file
-        simulation_info_file = os.path.join(main_folder, "simulation_info.yaml")
-        with open(simulation_info_file, "w", encoding="utf-8") as f:
-            yaml.dump(simulation_info, f)
+        self._write_info(simulation_info)
 
         simulation_study_file = os.path.join(main_folder, "simulation_study.yaml")
         with open(simulation_study_file, "w", encoding="utf-8") as f:
-            yaml.dump(asdict(self), f)
+            yaml.dump(asdict(self), f, Dumper=YamlDumper)
+
+        # build the information DataFrame
+        dataframe_info = rows_to_dataframe(dataframe_rows, keys_for_df)
 
-        # save the combinations info
-        simulation_combos_file = os.path.join(main_folder, "simulation_combos.pkl")
-        with open(simulation_combos_file, "wb") as f:
-            pickle.dump(simulation_combos, f)
-        
         # save the information DataFrame
         # if present, remove the column "simulation_status"
         if "simulation_status" in dataframe_info.columns:
@@ -379,6 +472,160 @@ class SimulationStudy:
 
         self.folders_created = True
 
+    def _read_info(self, use_cache=True):
+        """Reads the simulation info file of the study. Studies created by
+        older versions of the package store it as YAML, which is read if the
+        JSON file is not there.
+
+        Parameters
+        ----------
+        use_cache : bool, optional
+            If True, the info parsed the last time is reused when the file did
+            not change. Pass False to always parse the file again, as the
+            read-modify-write of a status update does, since other processes
+            may rewrite the file within the resolution of its timestamps. The
+            default is True.
+
+        Returns
+        -------
+        simulation_info : dict
+            The simulation info. The status of every simulation is stored in
+            the "status" dictionary, indexed by simulation name.
+        """
+        main_folder = os.path.join(self.study_path, self.study_name)
+        simulation_info_file = os.path.join(main_folder, "simulation_info.json")
+        try:
+            stat = os.stat(simulation_info_file)
+        except FileNotFoundError:
+            with open(
+                os.path.join(main_folder, "simulation_info.yaml"), "r", encoding="utf-8"
+            ) as f:
+                simulation_info = yaml.load(f, Loader=YamlLoader)
+            # older versions of the package store a list of simulations for
+            # each status, convert them to the status dictionary
+            if "status" not in simulation_info:
+                simulation_info["status"] = {
+                    sim: status
+                    for status in SIM_STATUSES
+                    for sim in simulation_info.pop(f"sim_{status}", [])
+                }
+            return simulation_info
+
+        # parse the file only if it changed since it was last read or written,
+        # the callers are free to modify the returned info. The file is always
+        # replaced by a new one, so its inode tells apart two writes that fall
+        # in the same timestamp tick with the same size
+        file_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if not use_cache or self._info_cache is None or self._info_cache[0] != file_key:
+            with open(simulation_info_file, "r", encoding="utf-8") as f:
+                self._info_cache = (file_key, json.load(f))
+        simulation_info = self._info_cache[1]
+        return {**simulation_info, "status": dict(simulation_info["status"])}
+
+    def _write_info(self, simulation_info):
+        """Writes the simulation info file of the study. It is a file only
+        handled by the package, so it is stored as JSON, which is much faster
+        to read and write than YAML. The file is replaced atomically, so that
+        a concurrent reader never finds it half written.
+
+        Parameters
+        ----------
+        simulation_info : dict
+            The simulation info.
+        """
+        main_folder = os.path.join(self.study_path, self.study_name)
+        simulation_info_file = os.path.join(main_folder, "simulation_info.json")
+        write_file_atomically(simulation_info_file, json.dumps(simulation_info))
+        stat = os.stat(simulation_info_file)
+        self._info_cache = (
+            (stat.st_ino, stat.st_mtime_ns, stat.st_size),
+            {**simulation_info, "status": dict(simulation_info["status"])},
+        )
+        # the old YAML file, if any, is now outdated
+        legacy_file = os.path.join(main_folder, "simulation_info.yaml")
+        if os.path.exists(legacy_file):
+            os.remove(legacy_file)
+
+    @staticmethod
+    def _combination_folder_name(combination, block_cache=None):
+        """Returns the name of the folder of a parameter combination.
+
+        Parameters
+        ----------
+        combination : list
+            The parameter combination, as yielded by
+            yield_parameter_combinations.
+        block_cache : dict, optional
+            Cache of the blocks of the name, indexed by position of the
+            parameter in the combination and index of its value. Pass the same
+            dictionary when naming the combinations of a study, so that every
+            value is formatted only once.
+
+        Returns
+        -------
+        foldername : str
+            The name of the folder.
+        """
+        if block_cache is None:
+            block_cache = {}
+        str_blocks = []
+        for j, c in enumerate(combination):
+            if c[1] is None:
+                continue
+            block = block_cache.get((j, c[4]))
+            if block is None:
+                block = c[1] + "_" + number_filename_formatter(c[2], c[4])
+                block_cache[(j, c[4])] = block
+            str_blocks.append(block)
+        return "case_" + "_".join(str_blocks)
+
+    def _read_combos(self, sim_names):
+        """Returns the parameter combination of the given simulations. The
+        combinations are not stored, but enumerated again from the parameters
+        inspected, keeping only the requested ones. Studies created by older
+        versions of the package store all the combinations in a file, which
+        is read instead if it is there.
+
+        Parameters
+        ----------
+        sim_names : list
+            The names of the simulations.
+
+        Returns
+        -------
+        simulation_combos : dict
+            The parameter combinations, indexed by simulation name.
+
+        Raises
+        ------
+        ValueError
+            If the combination of some of the simulations is not found, e.g.
+            because the parameters inspected changed after the folders were
+            created.
+        """
+        sim_names = set(sim_names)
+        main_folder = os.path.join(self.study_path, self.study_name)
+        simulation_combos_file = os.path.join(main_folder, "simulation_combos.pkl")
+        if os.path.exists(simulation_combos_file):
+            with open(simulation_combos_file, "rb") as f:
+                simulation_combos = pickle.load(f)
+        else:
+            simulation_combos = {}
+            name_blocks = {}
+            for combination in self.yield_parameter_combinations():
+                foldername = self._combination_folder_name(combination, name_blocks)
+                if foldername in sim_names:
+                    simulation_combos[foldername] = combination
+
+        missing_sims = sim_names - simulation_combos.keys()
+        if missing_sims:
+            raise ValueError(
+                "The parameter combination of the following simulations was not"
+                " found, the parameters inspected may have changed since the"
+                " folders were created: " + ", ".join(sorted(missing_sims))
+            )
+        return simulation_combos
+
     def set_sim_status(self, sim_name, status):
         """Sets the simulation status in the simulation info file inside its folder.
 
@@ -390,94 +637,133 @@ class SimulationStudy:
             The status to set. Must be one of the following: 'not_started',
             'running', 'finished', 'interrupted', 'error'.
         """
-        # load the simulation info
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
-
-        # update the simulation status
-        # check if the simulation is in one of the lists
-        if (
-            sim_name
-            not in simulation_info["sim_not_started"]
-            + simulation_info["sim_running"]
-            + simulation_info["sim_finished"]
-            + simulation_info["sim_interrupted"]
-            + simulation_info["sim_error"]
-        ):
+        # load the simulation info, always from the file, as other processes
+        # (e.g. the workers of job_run_local) may have just updated it
+        simulation_info = self._read_info(use_cache=False)
+
+        self._move_sim_status(simulation_info, sim_name, status)
+        self._set_sim_status_in_folder(sim_name, status)
+
+        # save the simulation info
+        self._write_info(simulation_info)
+
+    @staticmethod
+    def _move_sim_status(simulation_info, sim_name, status):
+        """Moves a simulation to the given status in an already loaded
+        simulation info dictionary, without saving it.
+
+        Parameters
+        ----------
+        simulation_info : dict
+            The simulation info dictionary.
+        sim_name : str
+            The name of the simulation.
+        status : str
+            The status to set.
+        """
+        if status not in SIM_STATUSES:
             raise ValueError(
-                f"Simulation {sim_name} not found in simulation info file."
+                f"Status {status} is not valid, must be one of {SIM_STATUSES}."
             )
-
-        # where is the simulation in the dictionary simulation_info?
-        # find it and move the simulation in the new status
-        if sim_name in simulation_info["sim_not_started"]:
-            simulation_info["sim_not_started"].remove(sim_name)
-            prev_loc = "not_started"
-        elif sim_name in simulation_info["sim_running"]:
-            simulation_info["sim_running"].remove(sim_name)
-            prev_loc = "running"
-        elif sim_name in simulation_info["sim_finished"]:
-            simulation_info["sim_finished"].remove(sim_name)
-            prev_loc = "finished"
-        elif sim_name in simulation_info["sim_interrupted"]:
-            simulation_info["sim_interrupted"].remove(sim_name)
-            prev_loc = "interrupted"
-        elif sim_name in simulation_info["sim_error"]:
-            simulation_info["sim_error"].remove(sim_name)
-            prev_loc = "error"
-        else:
+        prev_loc = simulation_info["status"].get(sim_name)
+        if prev_loc is None:
             raise ValueError(
                 f"Simulation {sim_name} not found in simulation info file."
             )
 
         # move the simulation in the new status
-        simulation_info[f"sim_{status}"].append(sim_name)
+        simulation_info["status"][sim_name] = status
         if status != prev_loc:
             print(f"Moved {sim_name} from {prev_loc} to {status}")
 
-        # update the simulation status in its folder
+    @staticmethod
+    def _sims_by_status(simulation_info):
+        """Groups the simulations by status, in a single pass over the
+        simulation info.
+
+        Parameters
+        ----------
+        simulation_info : dict
+            The simulation info dictionary.
+
+        Returns
+        -------
+        sims_by_status : dict
+            Dictionary with a list of simulation names for each status.
+        """
+        sims_by_status = {status: [] for status in SIM_STATUSES}
+        for sim, status in simulation_info["status"].items():
+            sims_by_status[status].append(sim)
+        return sims_by_status
+
+    def _set_sim_status_in_folder(self, sim_name, status):
+        """Sets the simulation status in the parameter file inside the
+        simulation folder.
+
+        Parameters
+        ----------
+        sim_name : str
+            The name of the simulation.
+        status : str
+            The status to set.
+        """
         folder_path = os.path.join(self.study_path, self.study_name, "scan", sim_name)
         parameter_file = os.path.join(folder_path, self.config_file)
         with open(parameter_file, "r", encoding="utf-8") as f:
-            parameters = yaml.safe_load(f)
+            parameters = yaml.load(f, Loader=YamlLoader)
 
+        # nothing to write if the status is already the right one
+        if parameters.get("simulation_status") == status:
+            return
         parameters["simulation_status"] = status
 
-        with open(parameter_file, "w", encoding="utf-8") as f:
-            yaml.dump(parameters, f)
-
-        # save the simulation info
-        with open(simulation_info_file, "w", encoding="utf-8") as f:
-            yaml.dump(simulation_info, f)
+        dump_config(parameters, parameter_file)
 
     def _update_remote_status(self):
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        """Updates the status of the simulations that finished or failed
+        remotely, according to the marker files in remote_touch_files.
 
-        sim_to_check = (
-            simulation_info["sim_not_started"] + simulation_info["sim_running"]
-        )
+        Returns
+        -------
+        simulation_info : dict
+            The updated simulation info.
+        """
+        simulation_info = self._read_info()
+
+        sims_by_status = self._sims_by_status(simulation_info)
+        sim_to_check = chain(sims_by_status["not_started"], sims_by_status["running"])
         folder_path = os.path.join(
             self.study_path, self.study_name, "remote_touch_files"
         )
+        # all the marker files are in the same folder, so a single listing
+        # replaces a stat call per simulation (slow on shared filesystems)
+        touch_files = set(os.listdir(folder_path))
+        updated = []
         for sim in sim_to_check:
-            if os.path.exists(os.path.join(folder_path, "FINISHED_" + sim)):
-                self.set_sim_status(sim, "finished")
+            if "FINISHED_" + sim in touch_files:
+                self._move_sim_status(simulation_info, sim, "finished")
+                updated.append((sim, "finished"))
                 print(f"REMOTE CHECK: Simulation {sim} finished remotely.")
-            elif os.path.exists(os.path.join(folder_path, "ERROR_" + sim)):
-                self.set_sim_status(sim, "error")
+            elif "ERROR_" + sim in touch_files:
+                self._move_sim_status(simulation_info, sim, "error")
+                updated.append((sim, "error"))
                 print(f"REMOTE CHECK: Simulation {sim} failed remotely.")
             else:
                 # self.set_sim_status(sim, "not_started")
                 print(f"REMOTE CHECK: Simulation {sim} has either not started or is still running.")
                 # print("Not updating status.")
 
+        # save the simulation info once, after all the updates
+        if updated:
+            self._write_info(simulation_info)
+            with ThreadPoolExecutor(max_workers=IO_POOL_WORKERS) as executor:
+                for future in [
+                    executor.submit(self._set_sim_status_in_folder, sim, status)
+                    for sim, status in updated
+                ]:
+                    future.result()
+        return simulation_info
+
     def print_sim_status(self, update_remote_status=True):
         """Prints the simulation status. If update_remote_status is True, also
         checks if the simulations running remotely are finished by checking the
@@ -493,62 +779,39 @@ class SimulationStudy:
             accordingly. The default is True.
         """
         if update_remote_status:
-            self._update_remote_status()
+            simulation_info = self._update_remote_status()
+        else:
+            # load the simulation info
+            simulation_info = self._read_info()
 
-        # load the simulation info
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        sims_by_status = self._sims_by_status(simulation_info)
 
         print("------------------------------------------------------------")
         print("Simulation status:")
         print("------------------------------------------------------------")
         print(
-            f"Number of simulations not started: {len(simulation_info['sim_not_started'])}"
+            f"Number of simulations not started: {len(sims_by_status['not_started'])}"
         )
-        print(f"Number of simulations running: {len(simulation_info['sim_running'])}")
-        print(f"Number of simulations finished: {len(simulation_info['sim_finished'])}")
+        print(f"Number of simulations running: {len(sims_by_status['running'])}")
+        print(f"Number of simulations finished: {len(sims_by_status['finished'])}")
         print(
-            f"Number of simulations interrupted: {len(simulation_info['sim_interrupted'])}"
+            f"Number of simulations interrupted: {len(sims_by_status['interrupted'])}"
         )
-        print(f"Number of simulations with error: {len(simulation_info['sim_error'])}")
-
-        if len(simulation_info["sim_not_started"]) > 0:
-            print("------------------------------------------------------------")
-            print("Simulations not started:")
-            print("------------------------------------------------------------")
-            for sim in sorted(simulation_info["sim_not_started"]):
-                print(sim)
-
-        if len(simulation_info["sim_running"]) > 0:
-            print("------------------------------------------------------------")
-            print("Simulations running:")
-            print("------------------------------------------------------------")
-            for sim in sorted(simulation_info["sim_running"]):
-                print(sim)
-
-        if len(simulation_info["sim_finished"]) > 0:
-            print("------------------------------------------------------------")
-            print("Simulations finished:")
-            print("------------------------------------------------------------")
-            for sim in sorted(simulation_info["sim_finished"]):
-                print(sim)
-
-        if len(simulation_info["sim_interrupted"]) > 0:
-            print("------------------------------------------------------------")
-            print("Simulations interrupted:")
-            print("------------------------------------------------------------")
-            for sim in sorted(simulation_info["sim_interrupted"]):
-                print(sim)
-
-        if len(simulation_info["sim_error"]) > 0:
-            print("------------------------------------------------------------")
-            print("Simulations with error:")
-            print("------------------------------------------------------------")
-            for sim in sorted(simulation_info["sim_error"]):
-                print(sim)
+        print(f"Number of simulations with error: {len(sims_by_status['error'])}")
+
+        for status, title in (
+            ("not_started", "Simulations not started:"),
+            ("running", "Simulations running:"),
+            ("finished", "Simulations finished:"),
+            ("interrupted", "Simulations interrupted:"),
+            ("error", "Simulations with error:"),
+        ):
+            if len(sims_by_status[status]) > 0:
+                print("------------------------------------------------------------")
+                print(title)
+                print("------------------------------------------------------------")
+                # one print for the whole list, rather than one per simulation
+                print("\n".join(sorted(sims_by_status[status])))
         print("------------------------------------------------------------")
 
     def reset_simulations(
@@ -577,89 +840,105 @@ class SimulationStudy:
             If True, clears the log folder. The default is False.
         """
         main_folder = os.path.join(self.study_path, self.study_name)
-        simulation_info_file = os.path.join(main_folder, "simulation_info.yaml")
-        simulation_combos_file = os.path.join(main_folder, "simulation_combos.pkl")
-
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        # paths used over and over in the loop below
+        scan_folder = os.path.join(main_folder, "scan")
+        original_folder_copy = os.path.join(main_folder, "original_folder")
+        remote_touch_folder = os.path.join(main_folder, "remote_touch_files")
+        config_file = self.config_file
 
-        with open(simulation_combos_file, "rb") as f:
-            simulation_combos = pickle.load(f)
+        simulation_info = self._read_info()
 
+        sims_by_status = self._sims_by_status(simulation_info)
         sim_to_reset = []
         if reset_all:
             sim_to_reset = (
-                simulation_info["sim_not_started"]
-                + simulation_info["sim_running"]
-                + simulation_info["sim_finished"]
-                + simulation_info["sim_error"]
+                sims_by_status["not_started"]
+                + sims_by_status["running"]
+                + sims_by_status["finished"]
+                + sims_by_status["error"]
             )
         else:
             sim_to_reset = (
-                simulation_info["sim_not_started"]
-                + simulation_info["sim_running"]
-                + simulation_info["sim_error"]
-                + simulation_info["sim_interrupted"]
+                sims_by_status["not_started"]
+                + sims_by_status["running"]
+                + sims_by_status["error"]
+                + sims_by_status["interrupted"]
             )
 
-        for sim in sim_to_reset:
-            print(f"Resetting {sim}")
-            folder_path = os.path.join(main_folder, "scan", sim)
-            if restore_original:
-                # remove the content of the folder
-                shutil.rmtree(folder_path)
-                # create the folder
-                os.makedirs(folder_path, exist_ok=True)
-                clone_folder_content(
-                    os.path.join(main_folder, "original_folder"), folder_path
-                )
-                # open the parameter file and update the parameters
-                parameter_file = os.path.join(folder_path, self.config_file)
-                with open(parameter_file, "r", encoding="utf-8") as f:
-                    parameters = yaml.safe_load(f)
+        if restore_original:
+            # the parameter file is parsed only once, and copied for each
+            # simulation to restore
+            with open(
+                os.path.join(original_folder_copy, config_file), "r", encoding="utf-8"
+            ) as f:
+                template_parameters = yaml.load(f, Loader=YamlLoader)
+            simulation_combos = self._read_combos(sim_to_reset)
+
+        def restore_folder(folder_path, parameters):
+            # bring the content of the folder back to the original one,
+            # copying again only what was modified by the simulation
+            os.makedirs(folder_path, exist_ok=True)
+            restore_folder_content(
+                original_folder_copy, folder_path, exclude=(config_file,)
+            )
+            # save the parameter file, unless it was left as it was written
+            dump_config(
+                parameters, os.path.join(folder_path, config_file), skip_unchanged=True
+            )
 
-                for c in simulation_combos[sim]:
-                    update_nested_dict(parameters, c[0], c[2])
+        def reset_folder(sim):
+            self._set_sim_status_in_folder(sim, "not_started")
+            # if the simulation folder has its file in remote_touch_files
+            # remove it
+            for prefix in ("FINISHED_", "ERROR_"):
+                touch_file = os.path.join(remote_touch_folder, prefix + sim)
+                if os.path.exists(touch_file):
+                    os.remove(touch_file)
+
+        with ThreadPoolExecutor(max_workers=IO_POOL_WORKERS) as executor:
+            futures = []
+            for sim in sim_to_reset:
+                print(f"Resetting {sim}")
+                folder_path = os.path.join(scan_folder, sim)
+                if restore_original:
+                    # update the parameters
+                    combination = simulation_combos[sim]
+                    key_parts = [c[0].split("/") for c in combination]
+                    parameters = copy_nested_dict_paths(template_parameters, key_parts)
+
+                    for keys, c in zip(key_parts, combination):
+                        update_nested_dict_parts(parameters, keys, c[2])
+
+                    parameters["simulation_status"] = "not_started"
+
+                    futures.append(
+                        executor.submit(restore_folder, folder_path, parameters)
+                    )
+                else:
+                    futures.append(executor.submit(reset_folder, sim))
+                self._move_sim_status(simulation_info, sim, "not_started")
 
-                parameters["simulation_status"] = "not_started"
+            # wait for all the folders, raising here any error from the threads
+            for future in futures:
+                future.result()
 
-                # save the parameter file
-                with open(parameter_file, "w", encoding="utf-8") as f:
-                    yaml.dump(parameters, f)
-                self.set_sim_status(sim, "not_started")
-            else:
-                self.set_sim_status(sim, "not_started")
-                # if the simulation folder has its file in remote_touch_files
-                # remove it
-                if os.path.exists(
-                    os.path.join(main_folder, "remote_touch_files", "FINISHED_" + sim)
-                ):
-                    os.remove(
-                        os.path.join(
-                            main_folder, "remote_touch_files", "FINISHED_" + sim
-                        )
-                    )
-                if os.path.exists(
-                    os.path.join(main_folder, "remote_touch_files", "ERROR_" + sim)
-                ):
-                    os.remove(
-                        os.path.join(main_folder, "remote_touch_files", "ERROR_" + sim)
-                    )
+        # save the simulation info once, after all the updates
+        self._write_info(simulation_info)
 
         if clear_out_folder:
-            out_folder = os.path.join(main_folder, "out")
-            for f in os.listdir(out_folder):
-                os.remove(os.path.join(out_folder, f))
+            with os.scandir(os.path.join(main_folder, "out")) as entries:
+                for entry in entries:
+                    os.remove(entry.path)
 
         if clear_err_folder:
-            err_folder = os.path.join(main_folder, "err")
-            for f in os.listdir(err_folder):
-                os.remove(os.path.join(err_folder, f))
+            with os.scandir(os.path.join(main_folder, "err")) as entries:
+                for entry in entries:
+                    os.remove(entry.path)
 
         if clear_log_folder:
-            log_folder = os.path.join(main_folder, "log")
-            for f in os.listdir(log_folder):
-                os.remove(os.path.join(log_folder, f))
+            with os.scandir(os.path.join(main_folder, "log")) as entries:
+                for entry in entries:
+                    os.remove(entry.path)
 
     def nuke_simulation(self):
         """Removes the entire folder where the simulation is contained!!!"""
@@ -672,54 +951,34 @@ class SimulationStudy:
     @property
     def finished(self):
         """Returns a list of the simulations that are finished."""
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        simulation_info = self._read_info()
 
-        return simulation_info["sim_finished"]
+        return self._sims_by_status(simulation_info)["finished"]
 
     @property
     def not_started(self):
         """Returns a list of the simulations that are not started."""
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        simulation_info = self._read_info()
 
-        return simulation_info["sim_not_started"]
+        return self._sims_by_status(simulation_info)["not_started"]
 
     @property
     def running(self):
         """Returns a list of the simulations that are running."""
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        simulation_info = self._read_info()
 
-        return simulation_info["sim_running"]
+        return self._sims_by_status(simulation_info)["running"]
 
     @property
     def interrupted(self):
         """Returns a list of the simulations that are interrupted."""
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        simulation_info = self._read_info()
 
-        return simulation_info["sim_interrupted"]
+        return self._sims_by_status(simulation_info)["interrupted"]
 
     @property
     def error(self):
         """Returns a list of the simulations that have error."""
-        simulation_info_file = os.path.join(
-            self.study_path, self.study_name, "simulation_info.yaml"
-        )
-        with open(simulation_info_file, "r", encoding="utf-8") as f:
-            simulation_info = yaml.safe_load(f)
+        simulation_info = self._read_info()
 
-        return simulation_info["sim_error"]
+        return self._sims_by_status(simulation_info)["error"]
@@ -1,9 +1,17 @@
 import argparse
 import os
+import shutil
 import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import yaml
 
+# use the libyaml bindings when they are available, as they are much faster
+# than the pure Python parser and emitter
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
 
 def eos_stage_in(eos_path: str, destination: str):
     basename = os.path.basename(eos_path)
@@ -28,34 +36,69 @@ def eos_stage_in_directory(eos_path: str, destination: str):
     return destination
 
 
+def eos_stage_in_path(eos_path: str, destination: str):
+    # if eos_path is a directory, use eos_stage_in_directory
+    # check if it is a directory properly, this is a stat on EOS as well, so
+    # it is done here, in the worker threads, and not before submitting
+    if os.path.isdir(eos_path):
+        print(f"Staging in directory {eos_path}")
+        return eos_stage_in_directory(eos_path, destination)
+    print(f"Staging in file {eos_path}")
+    return eos_stage_in(eos_path, destination)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--yaml_path", help="The path to the config file")
     args = parser.parse_args()
 
-    with open(args.yaml_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-
-    to_move_dict = {}
-
-    # scan the dictionary for eos paths
-    for key, value in config.items():
-        if isinstance(value, str) and (value.startswith("/eos") or value.startswith("/afs")):
-            to_move_dict[key] = value
-
-    # move the files
-    for key, value in to_move_dict.items():
-        # if value is a directory, use eos_stage_in_directory
-        # check if it is a directory properly
-        if os.path.isdir(value):
-            print(f"Staging in directory {value}")
-            config[key] = eos_stage_in_directory(value, "./input_eos")
-        else:
-            print(f"Staging in file {value}")
-            config[key] = eos_stage_in(value, "./input_eos")
-
-    # write the new config file
-    with open(args.yaml_path, "w", encoding="utf-8") as f:
-        yaml.dump(config, f)
+    # read the whole file at once, the parser works on the bytes directly
+    with open(args.yaml_path, "rb") as f:
+        config = yaml.load(f.read(), Loader=YamlLoader)
+
+    # scan the dictionary for eos paths and move the files, the copies are
+    # independent and bound by the latency of EOS, so they are all started
+    # at once. Every source is copied only once, even if several keys refer
+    # to it, and two sources are never copied to the same destination
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = {}
+        staged_keys = {}
+        destinations = {}
+        for key, value in config.items():
+            if not (isinstance(value, str) and value.startswith(("/eos", "/afs"))):
+                continue
+            staged_keys[key] = value
+            if value in futures:
+                continue
+            basename = os.path.basename(value)
+            if basename in destinations:
+                raise ValueError(
+                    f"{value} and {destinations[basename]} would both be staged"
+                    f" in as ./input_eos/{basename}"
+                )
+            destinations[basename] = value
+            futures[value] = executor.submit(eos_stage_in_path, value, "./input_eos")
+        for key, value in staged_keys.items():
+            config[key] = futures[value].result()
+
+    # write the new config file, rendered in memory and written at once to a
+    # uniquely named temporary file that then replaces it, so that it is never
+    # left half written, and the temporary file is removed if anything fails
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(args.yaml_path)),
+        prefix="." + os.path.basename(args.yaml_path) + ".",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(yaml.dump(config, Dumper=YamlDumper))
+        shutil.copymode(args.yaml_path, tmp_path)
+        os.replace(tmp_path, args.yaml_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
 
     print("Done staging in files from EOS.")
@@ -1,18 +1,213 @@
+import json
 import os
+import re
 import shutil
+import string
+import tempfile
+import numpy as np
 import pandas as pd
+import yaml
 
-def clone_folder_content(source_folder, destination_folder):
+# number of threads of the pools that overlap the file system operations over
+# many simulation folders, which are I/O bound rather than CPU bound
+IO_POOL_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# use the libyaml bindings when they are available, as they are much faster
+# than the pure Python parser and emitter, falling back to the latter
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class YamlDumper(getattr(yaml, "CSafeDumper", yaml.SafeDumper)):
     """
-    Clones the content of a folder to another folder.
+    Safe YAML dumper of the package. It is a subclass, so that the custom
+    representers are registered here and not on the PyYAML dumpers.
+    """
+
+
+def scan_folder_content(source_folder, exclude=()):
+    """
+    Lists the content of a folder, to clone it many times with
+    clone_folder_content without scanning it again every time. The items of
+    the folder whose name is in exclude are left out.
+
+    Returns
+    -------
+    folders : list
+        The subfolders, as paths relative to source_folder, parents first.
+    files : list
+        The files, as paths relative to source_folder.
+    """
+    folders = []
+    files = []
+    for root, dirnames, filenames in os.walk(source_folder, followlinks=True):
+        relative_root = os.path.relpath(root, source_folder)
+        if relative_root == os.curdir:
+            relative_root = ""
+            dirnames[:] = [d for d in dirnames if d not in exclude]
+            filenames = [f for f in filenames if f not in exclude]
+        folders.extend(os.path.join(relative_root, d) for d in dirnames)
+        files.extend(os.path.join(relative_root, f) for f in filenames)
+    return folders, files
+
+
+def clone_folder_content(
+    source_folder, destination_folder, exclude=(), folder_content=None
+):
     """
-    for item in os.listdir(source_folder):
-        source_path = os.path.join(source_folder, item)
+    Clones the content of a folder to another folder. The items of the source
+    folder whose name is in exclude are not cloned. The content of the source
+    folder can be passed as returned by scan_folder_content, in which case
+    exclude is ignored and the folder is not scanned.
+    """
+    if folder_content is None:
+        folder_content = scan_folder_content(source_folder, exclude)
+    folders, files = folder_content
+    for folder in folders:
+        os.makedirs(os.path.join(destination_folder, folder), exist_ok=True)
+    for file in files:
+        shutil.copy2(
+            os.path.join(source_folder, file), os.path.join(destination_folder, file)
+        )
+    # as shutil.copytree, copy the folder metadata once their content is there
+    for folder in reversed(folders):
+        shutil.copystat(
+            os.path.join(source_folder, folder),
+            os.path.join(destination_folder, folder),
+        )
+
+
+def restore_folder_content(source_folder, destination_folder, exclude=()):
+    """
+    Restores the content of a folder cloned with clone_folder_content to the
+    content of the source folder. Only the items that differ are touched:
+    the items missing in the source folder are removed, and the files that
+    are missing or whose size or modification time changed are copied again.
+    The items whose name is in exclude are left untouched.
+    """
+    # the directory entries cache the file type, so listing the folders with
+    # scandir spares a stat call per item
+    with os.scandir(source_folder) as it:
+        source_items = {entry.name: entry for entry in it}
+    with os.scandir(destination_folder) as it:
+        for entry in it:
+            if entry.name in source_items or entry.name in exclude:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+
+    for item, source_entry in source_items.items():
+        if item in exclude:
+            continue
+        source_path = source_entry.path
         destination_path = os.path.join(destination_folder, item)
-        if os.path.isdir(source_path):
-            shutil.copytree(source_path, destination_path)
+        if source_entry.is_dir():
+            if not os.path.isdir(destination_path):
+                if os.path.lexists(destination_path):
+                    os.remove(destination_path)
+                shutil.copytree(source_path, destination_path)
+            else:
+                restore_folder_content(source_path, destination_path)
+            continue
+        if os.path.isdir(destination_path) and not os.path.islink(destination_path):
+            shutil.rmtree(destination_path)
+        elif os.path.lexists(destination_path):
+            source_stat = source_entry.stat()
+            destination_stat = os.stat(destination_path)
+            # copy2 preserves the modification time, so an untouched clone
+            # has the same size and modification time of its source
+            if (
+                source_stat.st_size == destination_stat.st_size
+                and source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+            ):
+                continue
+        shutil.copy2(source_path, destination_path)
+
+
+# the process umask, read once since it can only be read by setting it,
+# applied to the files that mkstemp creates with owner-only permissions
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_file_atomically(file_path, content):
+    """
+    Writes a string to a file in a single pass, by writing it to a temporary
+    file in the same folder and then replacing the original file with it.
+    If the original file exists, its permissions are preserved. A crash
+    during the write never leaves a truncated file behind.
+    """
+    # the temporary file has a unique name, so concurrent writers of the same
+    # file never share it, and it is removed if the write fails
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path) or ".",
+        prefix="." + os.path.basename(file_path) + ".",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            # make sure the content is on disk before it replaces the original
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, tmp_path)
         else:
-            shutil.copy2(source_path, destination_path)
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def render_config(parameters, file_path):
+    """
+    Renders the content of a parameter file as a string. JSON files are
+    rendered with the json module, which is much faster than the YAML
+    emitter, any other file is rendered as YAML with YamlDumper.
+    """
+    if file_path.endswith(".json"):
+        # NumPy scalars are not JSON serializable, write them as numbers
+        return json.dumps(parameters, indent=2, default=lambda x: x.item())
+    return yaml.dump(parameters, Dumper=YamlDumper)
+
+
+def dump_config(parameters, file_path, skip_unchanged=False):
+    """
+    Writes a parameter file, rendered with render_config. If skip_unchanged
+    is True and the file already holds the very same content, it is left
+    untouched.
+    """
+    content = render_config(parameters, file_path)
+    if skip_unchanged:
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                if f.read() == content:
+                    return
+        except FileNotFoundError:
+            pass
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+class PlaceholderTemplate(string.Template):
+    """
+    A string.Template matching the "__REPLACE_WITH_<NAME>__" placeholders used
+    in the job templates, so that all the placeholders are replaced in a
+    single pass, while the "$" of the bash instructions are left untouched.
+    """
+
+    pattern = r"""
+        (?P<escaped>(?!))
+        |__REPLACE_WITH_(?P<named>[A-Z][A-Z0-9_]*?)__
+        |(?P<braced>(?!))
+        |(?P<invalid>(?!))
+    """
+    flags = re.VERBOSE
 
 
 def number_filename_formatter(number, alternative_idx=0, truncate=3):
@@ -22,7 +217,7 @@ def number_filename_formatter(number, alternative_idx=0, truncate=3):
         return str(number)
     # if instead is a float or something that can be converted to a float...    
     try:
-        string = "{:.{prec}}".format(float(number), prec=truncate)
+        string = f"{float(number):.{truncate}}"
     # if the float_number is not a float, use the alternative_idx
     except TypeError:
         string = str(alternative_idx)
@@ -40,8 +235,34 @@ def update_nested_dict(nested_dict, key_chain, value):
     ----------
     nested_dict
         The nested dictionary to update.
-    key_chain : str
-        The chain of keys to access the value to update.
+    key_chain : str or list
+        The chain of keys to access the value to update, either as a string
+        with the keys separated by "/" or already split in a list of keys.
+    value
+        The value to update.
+
+    Raises
+    ------
+    KeyError
+        If the key is not found in the dictionary.
+    """
+    if isinstance(key_chain, str):
+        key_chain = key_chain.split("/")
+    update_nested_dict_parts(nested_dict, key_chain, value)
+
+
+def update_nested_dict_parts(nested_dict, keys, value):
+    """
+    Updates a nested dictionary with a value given the list of keys, that is
+    the chain of keys already split. Use it to split the chain only once when
+    updating many dictionaries.
+
+    Parameters
+    ----------
+    nested_dict
+        The nested dictionary to update.
+    keys : list
+        The keys to access the value to update.
     value
         The value to update.
 
@@ -50,7 +271,6 @@ def update_nested_dict(nested_dict, key_chain, value):
     KeyError
         If the key is not found in the dictionary.
     """
-    keys = key_chain.split("/")
     current_dict = nested_dict
     for key in keys[:-1]:
         if key not in current_dict:
@@ -61,6 +281,109 @@ def update_nested_dict(nested_dict, key_chain, value):
     current_dict[keys[-1]] = value
 
 
+def copy_nested_dict_paths(nested_dict, keys_list):
+    """
+    Copies a nested dictionary so that it can be updated at the given lists
+    of keys, e.g. with update_nested_dict_parts, without touching the
+    original. Only the dictionaries along the keys are copied, everything
+    else is shared with the original, which is much cheaper than a deep copy.
+
+    Parameters
+    ----------
+    nested_dict
+        The nested dictionary to copy.
+    keys_list : list
+        The lists of keys that are going to be updated.
+
+    Returns
+    -------
+    new_dict : dict
+        The copied dictionary.
+    """
+    new_dict = dict(nested_dict)
+    copied = {id(new_dict)}
+    for keys in keys_list:
+        current_dict = new_dict
+        for key in keys[:-1]:
+            value = current_dict.get(key)
+            # a missing key is left to the update to report
+            if not isinstance(value, dict):
+                break
+            if id(value) not in copied:
+                value = dict(value)
+                copied.add(id(value))
+                current_dict[key] = value
+            current_dict = value
+    return new_dict
+
+
+def make_yaml_renderer(template, keys_list):
+    """
+    Renders a nested dictionary as YAML once, with placeholders at the given
+    lists of keys, and returns a function rendering it for other values at
+    those keys by replacing the placeholders, which is much faster than
+    dumping the whole dictionary every time. The output is the same as
+    dumping the updated dictionary with YamlDumper.
+
+    Parameters
+    ----------
+    template
+        The nested dictionary to render.
+    keys_list : list
+        The lists of keys of the values that change between renderings.
+
+    Returns
+    -------
+    render : callable or None
+        Function taking the list of values, in the order of keys_list, and
+        returning the YAML text, or None if a value cannot be written in
+        place of its placeholder, e.g. a list, which takes more lines. None
+        is returned instead of the function if the template cannot be
+        rendered with placeholders.
+    """
+    placeholders = [f"__SIMANAGER_PLACEHOLDER_{i}__" for i in range(len(keys_list))]
+    document = copy_nested_dict_paths(template, keys_list)
+    try:
+        for keys, placeholder in zip(keys_list, placeholders):
+            update_nested_dict_parts(document, keys, placeholder)
+    except (KeyError, ValueError):
+        return None
+    text = yaml.dump(document, Dumper=YamlDumper)
+    if any(text.count(placeholder) != 1 for placeholder in placeholders):
+        return None
+    # the placeholders are not in the order of keys_list in the text
+    order = sorted(range(len(placeholders)), key=lambda i: text.find(placeholders[i]))
+    pieces = []
+    for i in order:
+        piece, _, text = text.partition(placeholders[i])
+        pieces.append(piece)
+    pieces.append(text)
+
+    scalars = {}
+
+    def render(values):
+        text = [pieces[0]]
+        for i, piece in zip(order, pieces[1:]):
+            value = values[i]
+            # only the scalars the dumper never writes as aliases
+            if not (value is None or isinstance(value, (str, bool, int, float))):
+                return None
+            scalar = scalars.get((type(value), value))
+            if scalar is None:
+                # render the value as a mapping value, as in the document,
+                # only one-line values without spaces are written in place
+                # of the placeholder, as nothing around them depends on them
+                scalar = yaml.dump({"k": value}, Dumper=YamlDumper)[3:-1]
+                if "\n" in scalar or " " in scalar:
+                    return None
+                scalars[(type(value), value)] = scalar
+            text.append(scalar)
+            text.append(piece)
+        return "".join(text)
+
+    return render
+
+
 # Define a custom representer for integers
 def int_representer(dumper, data):
     return dumper.represent_scalar("tag:yaml.org,2002:int", str(data))
@@ -76,6 +399,14 @@ def numpy_scalar_representer(dumper, data):
     return dumper.represent_scalar("tag:yaml.org,2002:float", format(float(data)))
 
 
+# Register the custom representers for numerical types, once and only on the
+# dumper of the package
+YamlDumper.add_representer(int, int_representer)
+YamlDumper.add_representer(float, float_representer)
+YamlDumper.add_representer(np.int64, numpy_scalar_representer)
+YamlDumper.add_representer(np.float64, numpy_scalar_representer)
+
+
 def clean_script_from_templates(data):
     # remove everything above the tag "#___END_INITIAL_INSTRUCTIONS___"
     try:
@@ -91,19 +422,28 @@ def clean_script_from_templates(data):
 
 
 def flatten_dict(d, parent_key="", sep="/"):
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}{sep}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep).items())
+    # walk the nested dictionaries with a stack of iterators, in the same
+    # order as a recursion, but filling a single dictionary instead of
+    # building and merging one for every level
+    flat = {}
+    stack = [(parent_key, iter(d.items()))]
+    while stack:
+        parent_key, items = stack[-1]
+        for k, v in items:
+            new_key = f"{parent_key}{sep}{k}" if parent_key else k
+            if isinstance(v, dict):
+                stack.append((new_key, iter(v.items())))
+                break
+            flat[new_key] = v
         else:
-            items.append((new_key, v))
-    return dict(items)
+            stack.pop()
+    return flat
 
 
 def insert_nested_dict_in_dataframe(df, nested_dict, extra_dict):
     """
     Inserts a flattened nested dictionary and additional key-value pairs into a DataFrame as a new row.
+    It copies the whole DataFrame, to add many rows use rows_to_dataframe.
     """
     # Flatten the nested dictionary and merge it with the extra dictionary
     to_write_dict = {**flatten_dict(nested_dict), **extra_dict}
@@ -111,4 +451,18 @@ def insert_nested_dict_in_dataframe(df, nested_dict, extra_dict):
     # Convert the dictionary to a DataFrame with a single row and concatenate
     df_new_row = pd.DataFrame([to_write_dict])
     final_df = pd.concat([df, df_new_row], ignore_index=True)
-    return final_df
\ No newline at end of file
+    return final_df
+
+
+def rows_to_dataframe(rows, columns=()):
+    """
+    Builds a DataFrame from a list of rows, e.g. flattened nested dictionaries,
+    in a single pass. The columns are the given ones, followed by the other
+    keys of the rows in order of appearance, and the values are stored as
+    objects, as when the rows are inserted one by one in an empty DataFrame
+    with insert_nested_dict_in_dataframe.
+    """
+    columns = dict.fromkeys(columns)
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    return pd.DataFrame(rows, columns=list(columns), dtype=object)
@@ -25,9 +25,9 @@ parser.add_argument("--yaml_path", type=str, required=True)
 
 args = parser.parse_args()
 
-# open the yaml file
+# open the yaml file, with the faster libyaml parser when it is available
 with open(args.yaml_path, "r", encoding="utf-8") as f:
-    yaml_dict = yaml.safe_load(f)
+    yaml_dict = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
 
 # print the yaml file on standard output
 print_yaml_dict(yaml_dict)